@@ -64,12 +64,12 @@ def image_to_pixel_art(
     min_gamma = 0.1
     gamma = max(gamma, min_gamma)
 
-    # Remove background if enabled
+    # Remove background if enabled (this already yields a NumPy array),
+    # otherwise convert PIL image to NumPy array for OpenCV processing
     if background_removal and selfie_segmentation:
-        image = apply_background_removal(image, selfie_segmentation)
-
-    # Convert PIL image to NumPy array for OpenCV processing
-    image_np = np.array(image)
+        image_np = apply_background_removal(image, selfie_segmentation)
+    else:
+        image_np = np.array(image)
 
     # Enhance image brightness and contrast
     if brightness_boost != 1.0 or contrast_boost != 1.0:
@@ -131,7 +131,8 @@ def process_frame(
                 background_removal=background_removal,
                 black_and_white=black_and_white
             )
-            pixel_art_img.save(frame_path)
+            # Intermediate frame, re-encoded into the video later: favor encoding speed over size
+            pixel_art_img.save(frame_path, compress_level=1)
     except Exception as e:
         logging.error(f"Error processing frame {file_name}: {e}")
 
@@ -1,5 +1,6 @@
 # Standard library imports
 import argparse
+import json
 import logging
 import os
 import shutil
@@ -8,6 +9,7 @@ import sys
 import threading
 import time
 from collections import deque
+from functools import lru_cache
 from multiprocessing import Manager, Pool, cpu_count
 
 # Third-party imports
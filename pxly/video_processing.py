@@ -2,13 +2,10 @@
 
 from .pxly_imports import *
 from .utils import (
-    convert_to_mp4, 
-    extract_audio, 
-    remove_audio_from_video, 
-    execute_ffmpeg_command,
+    prepare_video,
     execute_ffmpeg_with_fallback,
     clean_up,
-    get_video_frame_rate
+    get_video_duration
 )
 from .pixel_conversion import (
     process_batch_frames,
@@ -34,6 +31,7 @@ def extract_segment(video_path, frame_dir, fps, segment_index, segment_duration)
         "-ss", str(start_time),
         "-t", str(segment_duration),
         "-vf", f"fps={fps}",
+        "-threads", "0",
         output_pattern
     ]
     success = subprocess.run(command, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL).returncode == 0
@@ -48,15 +46,9 @@ def extract_frames_parallel(video_path, frame_dir, fps):
     This method leverages multiple FFmpeg processes to speed up frame extraction.
     """
     os.makedirs(frame_dir, exist_ok=True)
-    cap = cv2.VideoCapture(video_path)
-    if not cap.isOpened():
-        logging.error(f"Cannot open video file: {video_path}")
+    duration = get_video_duration(video_path)
+    if not duration:
         return
-    total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
-    cap.release()
-
-    frame_rate = get_video_frame_rate(video_path)
-    duration = total_frames / frame_rate
     num_segments = max(1, int(cpu_count() / 4))  # Ensure at least one segment
     segment_duration = duration / num_segments
 
@@ -72,8 +64,11 @@ def extract_frames_parallel(video_path, frame_dir, fps):
         pool.starmap(extract_segment, args_list)
     logging.info("Frame extraction completed.\nConverting frames to pixel art...")
 
-def combine_pixel_frames_to_video(frame_dir, output_video_path, fps):
-    """Combine pixel art frames into a video using h264_nvenc or fallback to libx264."""
+def combine_pixel_frames_to_video(frame_dir, output_video_path, fps, audio_path=None):
+    """
+    Combine pixel art frames into a video using h264_nvenc or fallback to libx264.
+    If audio_path is given, the audio is muxed in by the same FFmpeg invocation.
+    """
     logging.info("Combining pixel art frames into video...")
     
     # Create a temporary directory to hold sequentially named frames
@@ -88,22 +83,32 @@ def combine_pixel_frames_to_video(frame_dir, output_video_path, fps):
         shutil.move(src, dst)
 
     frame_path_pattern = os.path.join(sequential_dir, "frame_%04d.png")
+
+    # Add the audio to the encoding command rather than running a separate merge pass
+    audio_input, audio_options = [], []
+    if audio_path:
+        audio_input = ["-i", audio_path]
+        audio_options = [
+            "-map", "0:v", "-map", "1:a",
+            "-c:a", "aac", "-b:a", "320k", "-strict", "experimental"
+        ]
     
     # Primary command using h264_nvenc
     primary_command = [
-        "ffmpeg", "-y", "-framerate", str(fps), "-i", frame_path_pattern,
+        "ffmpeg", "-y", "-framerate", str(fps), "-i", frame_path_pattern, *audio_input,
         "-c:v", "h264_nvenc",    # Hardware-accelerated encoder
         "-preset", "p7",         # Speed preset optimized for fastest encoding
         "-profile:v", "high",    # High profile for better quality
         "-pix_fmt", "yuv444p",   # Preserve color information
         "-b:v", "10M",           # Set bitrate to 10 Mbps (example)
         "-threads", "0",         # Utilize all available CPU cores
+        *audio_options,
         output_video_path
     ]
     
     # Fallback command using libx264 with -tune animation
     fallback_command = [
-        "ffmpeg", "-y", "-framerate", str(fps), "-i", frame_path_pattern,
+        "ffmpeg", "-y", "-framerate", str(fps), "-i", frame_path_pattern, *audio_input,
         "-c:v", "libx264",         # Software encoder
         "-preset", "veryslow",     # Slower encoding with better compression
         "-crf", "18",              # Quality control (lower CRF for higher quality)
@@ -111,6 +116,7 @@ def combine_pixel_frames_to_video(frame_dir, output_video_path, fps):
         "-pix_fmt", "yuv444p",     # Preserve color information
         "-tune", "animation",      # Tune for animations
         "-threads", "0",           # Utilize all available CPU cores
+        *audio_options,
         output_video_path
     ]
     
@@ -121,24 +127,6 @@ def combine_pixel_frames_to_video(frame_dir, output_video_path, fps):
     # Clean up the sequential frames directory
     shutil.rmtree(sequential_dir, ignore_errors=True)
 
-def merge_audio_with_pixel_video(pixel_video, audio_path, final_output):
-    """Combine the pixel art video with the original audio."""
-    logging.info("Merging audio with pixel art video...")
-    if audio_path:
-        success = execute_ffmpeg_command([
-            "ffmpeg", "-y", "-i", pixel_video, "-i", audio_path,
-            "-c:v", "copy", "-c:a", "aac", "-b:a", "320k", "-strict", "experimental", "-threads", "0",
-            final_output
-        ])  # Set highest bitrate and utilize all CPU cores
-        if success:
-            logging.info(f"Final video with audio saved to {final_output}.")
-        else:
-            logging.error("Failed to merge audio with pixel art video.")
-    else:
-        # If there's no audio, just copy the video
-        shutil.copy(pixel_video, final_output)
-        logging.info("No audio to merge. Final video saved without audio.")
-
 def process_video(
     input_path,
     fps,
@@ -158,20 +146,13 @@ def process_video(
     output_dir = os.path.dirname(input_path)
     original_filename = os.path.splitext(os.path.basename(input_path))[0]
 
-    mp4_video = convert_to_mp4(input_path, output_dir, target_width, target_height)
-    if not mp4_video:
+    # Decode the input once to produce both the silent video and the audio track
+    silent_video, audio_file = prepare_video(input_path, output_dir, target_width, target_height)
+    if not silent_video:
         return
 
-    original_fps = get_video_frame_rate(mp4_video)
-
-    audio_file = extract_audio(mp4_video, output_dir)
     if not audio_file:
         logging.warning("Proceeding without audio.")
-        audio_file = None
-
-    silent_video = remove_audio_from_video(mp4_video, output_dir)
-    if not silent_video:
-        return
 
     frame_dir = os.path.join(output_dir, "pxly_frames")
     
@@ -188,13 +169,11 @@ def process_video(
         black_white
     )
 
-    pixel_video_path = os.path.join(output_dir, f"{original_filename}_pxly_converted.mp4")
-    combine_pixel_frames_to_video(frame_dir, pixel_video_path, fps)
-
+    # Encode the frames and mux the original audio in a single FFmpeg invocation
     final_output = os.path.join(output_dir, f"{original_filename}_pxly.mp4")
-    merge_audio_with_pixel_video(pixel_video_path, audio_file, final_output)
+    combine_pixel_frames_to_video(frame_dir, final_output, fps, audio_file)
 
-    files_to_delete = [mp4_video, audio_file, pixel_video_path, silent_video] if audio_file else [mp4_video, pixel_video_path]
+    files_to_delete = [audio_file, silent_video]
     dirs_to_delete = [frame_dir]
     clean_up(files_to_delete, dirs_to_delete, input_path)
 